@@ -144,8 +144,10 @@ class DataHandler:
                     to_ignore.add(asset)
 
         with self.db.user_write() as write_cursor:
-            for asset in to_ignore:
-                self.db.add_to_ignored_assets(write_cursor=write_cursor, asset=asset)
+            self.db.ignore_multiple_assets(
+                write_cursor=write_cursor,
+                assets=[asset.identifier for asset in to_ignore],
+            )
 
         return to_ignore, already_ignored
 
@@ -48,6 +48,9 @@ def sanity_check_impl(
     # Fetch tables
     cursor.execute("SELECT name, sql FROM sqlite_master WHERE type='table'")
     for (name, raw_script) in cursor:
+        if name.startswith('sqlite_'):
+            continue  # internal tables such as sqlite_stat1 created by ANALYZE/PRAGMA optimize
+
         table_properties = re.findall(
             pattern=r'createtable.*?\((.+)\)',
             string=db_script_normalizer(raw_script),
@@ -290,6 +290,10 @@ class DBHandler:
     def logout(self) -> None:
         self.password = ''
         if self.conn is not None:  # pyright: ignore[reportUnnecessaryComparison]  # Can be None before/after connect.
+            try:
+                self.conn.optimize()
+            except sqlcipher.OperationalError as e:  # pylint: disable=no-member
+                log.error(f'At DB teardown could not optimize the DB: {e!s}')
             self.disconnect(conn_attribute='conn')
         if self.conn_transient is not None:  # pyright: ignore[reportUnnecessaryComparison]  # Can be None before/after connect.
             self.disconnect(conn_attribute='conn_transient')
@@ -2901,11 +2905,19 @@ class DBHandler:
         assets = self.query_owned_assets(cursor)
         GlobalDBHandler.add_user_owned_assets(assets)
 
+    @staticmethod
+    def _add_asset_identifier_rows(
+            write_cursor: 'DBCursor',
+            rows: Sequence[tuple[str]],
+    ) -> None:
+        """Adds the given (identifier,) rows to the user db asset identifier table"""
+        write_cursor.executemany('INSERT OR IGNORE INTO assets(identifier) VALUES(?);', rows)
+
     def add_asset_identifiers(self, write_cursor: 'DBCursor', asset_identifiers: list[str]) -> None:  # noqa: E501
         """Adds an asset to the user db asset identifier table"""
-        write_cursor.executemany(
-            'INSERT OR IGNORE INTO assets(identifier) VALUES(?);',
-            [(x,) for x in asset_identifiers],
+        self._add_asset_identifier_rows(
+            write_cursor=write_cursor,
+            rows=[(x,) for x in asset_identifiers],
         )
 
     def sync_globaldb_assets(self, write_cursor: 'DBCursor') -> None:
@@ -2915,11 +2927,11 @@ class DBHandler:
         are set to be part of the user's ignored list
         """
         with GlobalDBHandler().conn.read_ctx() as cursor:
-            # after successful update add all asset ids
-            cursor.execute('SELECT identifier from assets;')
-            self.add_asset_identifiers(
+            # after successful update add all asset ids. The fetched rows are already the
+            # (identifier,) bindings so pass them directly instead of iterating them in python
+            self._add_asset_identifier_rows(
                 write_cursor=write_cursor,
-                asset_identifiers=[x[0] for x in cursor],
+                rows=cursor.execute('SELECT identifier from assets;').fetchall(),
             )  # could do an attach DB here instead of two different cursor queries but probably would be overkill # noqa: E501
             globaldb_spam = cursor.execute(
                 'SELECT identifier FROM evm_tokens WHERE protocol=?',
@@ -498,6 +498,16 @@ class DBConnection:
             cursor.execute('VACUUM')
             cursor.close()
 
+    def optimize(self) -> None:
+        """Run PRAGMA optimize so that SQLite gathers statistics (ANALYZE) for the tables
+        whose queries would benefit from them and the query planner can pick the right indexes.
+        SQLite recommends running it right before closing a connection.
+        https://www.sqlite.org/pragma.html#pragma_optimize"""
+        with self.critical_section(), self.transaction_lock:  # make sure no writing happens while analyzing  # noqa: E501
+            cursor = self.cursor()
+            cursor.execute('PRAGMA optimize')
+            cursor.close()
+
     def wal_checkpoint(self, mode: Literal['', '(FULL)', '(PASSIVE)', '(TRUNCATE)'] = '') -> None:
         """
         Perform a WAL checkpoint operation.
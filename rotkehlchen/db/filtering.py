@@ -1770,11 +1770,24 @@ class DBSubtableSelectFilter(DBFilter):
 
 @dataclass(init=True, repr=True, eq=True, order=False, unsafe_hash=False, frozen=False)
 class DBIgnoredAssetsFilter(DBSubtableSelectFilter):
-    """Filter that filters ignored assets"""
+    """Filter that filters ignored assets
+
+    Uses a correlated (NOT) EXISTS instead of (NOT) IN so that each row is resolved with
+    a single probe of the UNIQUE(name, value) index of multisettings. A NULL asset_key
+    never matches so the NOT IN special case for NULL is handled implicitly.
+    """
     select_value: str = field(default='value', init=False)
     select_table: str = field(default='multisettings', init=False)
     select_condition: str = field(default="name='ignored_asset'", init=False)
 
+    def prepare(self) -> tuple[list[str], list[Any]]:
+        negation = 'NOT ' if self.operator == 'NOT IN' else ''
+        querystr = (
+            f'{negation}EXISTS (SELECT 1 FROM {self.select_table} WHERE {self.select_condition} '
+            f'AND {self.select_table}.{self.select_value}={self.asset_key})'
+        )
+        return [querystr], []
+
 
 class UserNotesFilterQuery(DBFilterQuery, FilterWithTimestamp):
 
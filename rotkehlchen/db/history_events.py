@@ -3,7 +3,7 @@ import logging
 from collections import defaultdict
 from collections.abc import Mapping, Sequence
 from dataclasses import dataclass
-from typing import TYPE_CHECKING, Any, Literal, Optional, TypeAlias, cast, overload
+from typing import TYPE_CHECKING, Any, Final, Literal, Optional, TypeAlias, cast, overload
 
 from solders.solders import Signature
 from sqlcipher3 import dbapi2 as sqlcipher
@@ -93,6 +93,13 @@ if TYPE_CHECKING:
 logger = logging.getLogger(__name__)
 log = RotkehlchenLogsAdapter(logger)
 
+# Selects the group identifiers of the latest LIMIT groups. Ordering only by timestamp lets
+# SQLite walk idx_history_events_timestamp backwards and stop once LIMIT distinct groups are
+# found instead of scanning and sorting the whole table.
+LATEST_GROUPS_SUBQUERY: Final = (
+    'SELECT DISTINCT group_identifier FROM history_events ORDER BY timestamp DESC LIMIT ?'
+)
+
 
 def _build_matched_movement_exclusion(
         filter_query: 'HistoryBaseEntryFilterQuery',
@@ -244,6 +251,24 @@ class DBHistoryEvents:
             ),
         )
 
+    @staticmethod
+    def _insert_history_event(write_cursor: 'DBCursor', event: HistoryBaseEntry) -> int | None:
+        """Write the rows of the event to all the tables it is serialized to. Returns
+        its identifier or None if it already exists. The ignored flag is left at its
+        default and has to be set by the caller.
+        """
+        identifier = None  # overwritten by first write
+        for idx, (insertquery, _, bindings) in enumerate(event.serialize_for_db()):
+            if idx == 0:
+                write_cursor.execute(f'INSERT OR IGNORE INTO {insertquery}', bindings)
+                if write_cursor.rowcount == 0:
+                    return None  # already exists
+                identifier = write_cursor.lastrowid  # keep identifier to use in next insertions
+            else:
+                write_cursor.execute(f'INSERT OR IGNORE INTO {insertquery}', (identifier, *bindings))  # noqa: E501
+
+        return identifier
+
     def add_history_event(
             self,
             write_cursor: 'DBCursor',
@@ -263,15 +288,8 @@ class DBHistoryEvents:
         - sqlcipher.IntegrityError: If the asset of the added history event does not exist in
         the DB. Can only happen if an event with an unresolved asset is passed.
         """
-        identifier = None  # overwritten by first write
-        for idx, (insertquery, _, bindings) in enumerate(event.serialize_for_db()):
-            if idx == 0:
-                write_cursor.execute(f'INSERT OR IGNORE INTO {insertquery}', bindings)
-                if write_cursor.rowcount == 0:
-                    return None  # already exists
-                identifier = write_cursor.lastrowid  # keep identifier to use in next insertions
-            else:
-                write_cursor.execute(f'INSERT OR IGNORE INTO {insertquery}', (identifier, *bindings))  # noqa: E501
+        if (identifier := self._insert_history_event(write_cursor, event)) is None:
+            return None  # already exists
 
         write_cursor.execute(
             'UPDATE history_events SET ignored=(CASE WHEN EXISTS '
@@ -302,25 +320,33 @@ class DBHistoryEvents:
           it collects the minimum timestamp and calls it once at the end.
         - Example: For 100 events, this reduces cache updates from 200 to 2.
 
+        The ignored flag of the added events is also set for the whole batch at the end
+        instead of with one UPDATE per event.
+
         Check add_history_event() to see possible Exceptions
         """
         if not history:
             return
 
         min_timestamp: TimestampMS | None = None
+        added_identifiers: list[int] = []
 
         # Add all events WITHOUT calling _mark_events_modified for each
         for event in history:
-            if (
-                self.add_history_event(
-                    write_cursor=write_cursor,
-                    event=event,
-                    skip_tracking=True,  # Skip tracking per-event
-                ) is not None  # Only track if event was actually added (not a duplicate)
-                and (min_timestamp is None or event.timestamp < min_timestamp)
-            ):
-                # Track the minimum timestamp
-                min_timestamp = event.timestamp
+            if (identifier := self._insert_history_event(write_cursor, event)) is None:
+                continue  # Only track if event was actually added (not a duplicate)
+
+            added_identifiers.append(identifier)
+            if min_timestamp is None or event.timestamp < min_timestamp:
+                min_timestamp = event.timestamp  # Track the minimum timestamp
+
+        # new rows default to not ignored so only the ones with an ignored asset need an update
+        for chunk, placeholders in get_query_chunks(added_identifiers):
+            write_cursor.execute(
+                f'UPDATE history_events SET ignored=1 WHERE identifier IN ({placeholders}) '
+                "AND asset IN (SELECT value FROM multisettings WHERE name='ignored_asset')",
+                chunk,
+            )
 
         # Call tracking ONCE for the entire batch with minimum timestamp
         # TODO (balances): add _mark_events_modified for min_timestamp if min_timestamp is not None
@@ -863,9 +889,9 @@ class DBHistoryEvents:
         else:
             cursor.execute(
                 'SELECT A.parent_identifier, A.value FROM history_events_mappings A JOIN '
-                f'history_events_mappings B ON A.parent_identifier=B.parent_identifier AND {where_str}'  # noqa: E501
-                'JOIN history_events C ON C.identifier=A.parent_identifier AND C.location=?',
-                (*bindings, location.serialize_for_db()),
+                'history_events C ON C.identifier=A.parent_identifier AND C.location=? '
+                f'WHERE {where_str}',
+                (location.serialize_for_db(), *bindings),
             )
 
         if mapping_state is not None:
@@ -909,8 +935,8 @@ class DBHistoryEvents:
             filter_query=filter_query,
         )
         # group_has_ignored_assets is added at the END so existing slicing logic is not affected.
-        # It's computed via a window function to detect groups with ignored assets even when
-        # those rows are filtered out by exclude_ignored_assets.
+        # It's computed via a correlated EXISTS over the group to detect groups with ignored
+        # assets even when those rows are filtered out by exclude_ignored_assets.
         base_suffix = f'{HISTORY_BASE_ENTRY_FIELDS}, {chain_fields}, {staking_fields}, {GROUP_HAS_IGNORED_ASSETS_FIELD} {join_clause}'  # noqa: E501
         if aggregate_by_group_ids:
             exclusion_sql, exclusion_bindings = _build_matched_movement_exclusion(filter_query)
@@ -932,10 +958,8 @@ class DBHistoryEvents:
         if entries_limit is None:
             suffix, limit = base_suffix, []
         else:
-            suffix, limit = (
-                f'* FROM (SELECT {base_suffix}) WHERE group_identifier IN ('
-                'SELECT DISTINCT group_identifier FROM history_events '
-                'ORDER BY timestamp DESC, sequence_index ASC LIMIT ?)'  # only select the last LIMIT groups  # noqa: E501
+            suffix, limit = (  # only select the last LIMIT groups
+                f'* FROM (SELECT {base_suffix}) WHERE group_identifier IN ({LATEST_GROUPS_SUBQUERY})'  # noqa: E501
             ), [entries_limit]
 
         if match_exact_events is False:  # return all group events instead of just the filtered ones.  # noqa: E501
@@ -953,9 +977,7 @@ class DBHistoryEvents:
             else:
                 inner_suffix = (
                     f'* FROM (SELECT {filter_query.get_columns()} {filter_query.get_join_query()}) '  # noqa: E501
-                    'WHERE group_identifier IN ('
-                    'SELECT DISTINCT group_identifier FROM history_events '
-                    'ORDER BY timestamp DESC, sequence_index ASC LIMIT ?)'
+                    f'WHERE group_identifier IN ({LATEST_GROUPS_SUBQUERY})'
                 )
                 inner_limit = [entries_limit]
 
@@ -1059,13 +1081,27 @@ class DBHistoryEvents:
             suffix, limit = base_suffix, []
         else:
             suffix, limit = (
-                f'* FROM (SELECT {base_suffix}) WHERE group_identifier IN ('
-                'SELECT DISTINCT group_identifier FROM history_events '
-                'ORDER BY timestamp DESC, sequence_index ASC LIMIT ?)'
+                f'* FROM (SELECT {base_suffix}) WHERE group_identifier IN ({LATEST_GROUPS_SUBQUERY})'  # noqa: E501
             ), [entries_limit]
 
         return f'SELECT * FROM (SELECT {suffix}) {filters}', limit + query_bindings
 
+    @staticmethod
+    def _create_group_exists_query(
+            group_identifier: str,
+            filter_query: HistoryBaseEntryFilterQuery,
+    ) -> tuple[str, list]:
+        """Returns a sql query that gives a row only if the group is in the filtered groups."""
+        query, bindings = DBHistoryEvents._create_history_events_count_query(
+            filter_query=filter_query,
+            entries_limit=None,
+            aggregate_by_group_ids=True,
+        )
+        return (
+            f'SELECT 1 FROM ({query}) WHERE group_identifier = ? LIMIT 1',
+            bindings + [group_identifier],
+        )
+
     @overload
     def get_history_events(
             self,
@@ -1289,9 +1325,12 @@ class DBHistoryEvents:
             type_idx + 1 + HISTORY_BASE_ENTRY_LENGTH +
             CHAIN_FIELD_LENGTH + ETH_STAKING_FIELD_LENGTH
         )
+        # Start of the chain and staking fields. Computed once instead of for every row.
+        chain_start_idx = data_start_idx + HISTORY_BASE_ENTRY_LENGTH
+        staking_start_idx = chain_start_idx + CHAIN_FIELD_LENGTH
 
         for entry in cursor:
-            # group_has_ignored_assets is computed via MAX(ignored) OVER window function,
+            # group_has_ignored_assets is computed via a correlated EXISTS over the group,
             # so it detects groups with ignored assets even when those rows are filtered out.
             group_has_ignored_assets = entry[group_has_ignored_assets_idx] == 1
             entry_type = HistoryBaseEntryType(entry[type_idx])
@@ -1299,10 +1338,7 @@ class DBHistoryEvents:
                 deserialized_event: HistoryBaseEntry
                 # Deserialize event depending on its type
                 if entry_type == HistoryBaseEntryType.EVM_EVENT:
-                    data = (
-                        entry[data_start_idx:data_start_idx + HISTORY_BASE_ENTRY_LENGTH + 1] +
-                        entry[data_start_idx + HISTORY_BASE_ENTRY_LENGTH + 1:data_start_idx + HISTORY_BASE_ENTRY_LENGTH + CHAIN_FIELD_LENGTH + 1]    # noqa: E501
-                    )
+                    data = entry[data_start_idx:staking_start_idx + 1]
                     deserialized_event = EvmEvent.deserialize_from_db(data)
                 elif entry_type in (
                         HistoryBaseEntryType.ETH_WITHDRAWAL_EVENT,
@@ -1314,7 +1350,7 @@ class DBHistoryEvents:
                         location_label_tuple +
                         entry[data_start_idx + 7:data_start_idx + 8] +
                         entry[data_start_idx + 10:data_start_idx + 12] +
-                        entry[data_start_idx + HISTORY_BASE_ENTRY_LENGTH + CHAIN_FIELD_LENGTH:data_start_idx + HISTORY_BASE_ENTRY_LENGTH + CHAIN_FIELD_LENGTH + ETH_STAKING_FIELD_LENGTH + 1]  # noqa: E501
+                        entry[staking_start_idx:staking_start_idx + ETH_STAKING_FIELD_LENGTH + 1]
                     )
                     if entry_type == HistoryBaseEntryType.ETH_WITHDRAWAL_EVENT:
                         deserialized_event = EthWithdrawalEvent.deserialize_from_db(data)
@@ -1334,14 +1370,13 @@ class DBHistoryEvents:
                         entry[data_start_idx:data_start_idx + 4] +
                         entry[data_start_idx + 5:data_start_idx + 6] +
                         entry[data_start_idx + 7:data_start_idx + 9] +
-                        entry[data_start_idx + HISTORY_BASE_ENTRY_LENGTH:data_start_idx + HISTORY_BASE_ENTRY_LENGTH + 1] +  # noqa: E501
-                        entry[data_start_idx + HISTORY_BASE_ENTRY_LENGTH + CHAIN_FIELD_LENGTH:data_start_idx + HISTORY_BASE_ENTRY_LENGTH + CHAIN_FIELD_LENGTH + 1]  # noqa: E501
+                        entry[chain_start_idx:chain_start_idx + 1] +
+                        entry[staking_start_idx:staking_start_idx + 1]
                     )
                     deserialized_event = EthDepositEvent.deserialize_from_db(data)
                 elif entry_type == HistoryBaseEntryType.SOLANA_EVENT:
                     deserialized_event = SolanaEvent.deserialize_from_db(
-                        entry[data_start_idx:data_start_idx + HISTORY_BASE_ENTRY_LENGTH + 1] +
-                        entry[data_start_idx + HISTORY_BASE_ENTRY_LENGTH + 1:data_start_idx + HISTORY_BASE_ENTRY_LENGTH + CHAIN_FIELD_LENGTH + 1],  # noqa: E501
+                        entry[data_start_idx:staking_start_idx + 1],
                     )
                 else:
                     data = entry[data_start_idx:group_has_ignored_assets_idx]
@@ -1703,6 +1738,14 @@ class DBHistoryEvents:
         or None if the group does not exist in the filtered results.
         """
         with self.db.conn.read_ctx() as cursor:
+            # Probe the lightweight count query first so that a group that doesn't exist or is
+            # filtered out is detected without joining the event subtables for every row.
+            if cursor.execute(*self._create_group_exists_query(
+                group_identifier=group_identifier,
+                filter_query=filter_query,
+            )).fetchone() is None:
+                return None
+
             # Build the full grouped query using the same logic as the main events query
             # This correctly handles all filter types (EVM, Solana, etc.) with proper JOINs
             query, query_bindings = self._create_history_events_query(
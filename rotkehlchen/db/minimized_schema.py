@@ -75,11 +75,11 @@ MINIMIZED_USER_DB_INDEXES = {
     "idx_history_events_timestamp": "createindexifnotexistsidx_history_events_timestamponhistory_events(timestamp)",
     "idx_history_events_location": "createindexifnotexistsidx_history_events_locationonhistory_events(location)",
     "idx_history_events_location_label": "createindexifnotexistsidx_history_events_location_labelonhistory_events(location_label)",
-    "idx_history_events_asset": "createindexifnotexistsidx_history_events_assetonhistory_events(asset)",
+    "idx_history_events_asset_timestamp": "createindexifnotexistsidx_history_events_asset_timestamponhistory_events(asset,timestamp)",
     "idx_history_events_type": "createindexifnotexistsidx_history_events_typeonhistory_events(type)",
     "idx_history_events_subtype": "createindexifnotexistsidx_history_events_subtypeonhistory_events(subtype)",
     "idx_history_events_ignored": "createindexifnotexistsidx_history_events_ignoredonhistory_events(ignored)",
-    "idx_history_event_links_right": "createindexifnotexistsidx_history_event_links_rightonhistory_event_links(right_event_id)",
+    "idx_history_events_mappings_name_value": "createindexifnotexistsidx_history_events_mappings_name_valueonhistory_events_mappings(name,value)",
     "idx_history_event_links_composite": "createindexifnotexistsidx_history_event_links_compositeonhistory_event_links(link_type,left_event_id,right_event_id)",
     "idx_history_event_link_ignores_type": "createindexifnotexistsidx_history_event_link_ignores_typeonhistory_event_link_ignores(link_type)",
     "unique_generic_accounting_rules": "createuniqueindexifnotexistsunique_generic_accounting_rulesonaccounting_rules(type,subtype,counterparty)whereis_event_specific=0",
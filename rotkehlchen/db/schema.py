@@ -936,16 +936,23 @@ CREATE TABLE IF NOT EXISTS event_metrics (
 # idx_history_events_type: Before: 12995ms, After: 7ms
 # idx_history_events_subtype: Before: 12937ms, After: 2ms
 # idx_history_events_ignored: Before: 14723ms, After: 5184ms
+# Lookups by history_event_links.right_event_id need no separate index since they are served
+# by the autoindex of the UNIQUE(right_event_id, link_type) constraint.
+# idx_history_events_asset_timestamp replaced idx_history_events_asset. It still serves the
+# asset lookups and also lets the asset movement matching search the timestamp range of each
+# asset in the index instead of checking every event of the asset.
+# idx_history_events_mappings_name_value serves the state marker lookups that filter mappings
+# by name and value, which the (parent_identifier, name, value) primary key can't serve.
 DB_CREATE_INDEXES = """
 CREATE INDEX IF NOT EXISTS idx_history_events_entry_type ON history_events(entry_type);
 CREATE INDEX IF NOT EXISTS idx_history_events_timestamp ON history_events(timestamp);
 CREATE INDEX IF NOT EXISTS idx_history_events_location ON history_events(location);
 CREATE INDEX IF NOT EXISTS idx_history_events_location_label ON history_events(location_label);
-CREATE INDEX IF NOT EXISTS idx_history_events_asset ON history_events(asset);
+CREATE INDEX IF NOT EXISTS idx_history_events_asset_timestamp ON history_events(asset, timestamp);
 CREATE INDEX IF NOT EXISTS idx_history_events_type ON history_events(type);
 CREATE INDEX IF NOT EXISTS idx_history_events_subtype ON history_events(subtype);
 CREATE INDEX IF NOT EXISTS idx_history_events_ignored ON history_events(ignored);
-CREATE INDEX IF NOT EXISTS idx_history_event_links_right ON history_event_links(right_event_id);
+CREATE INDEX IF NOT EXISTS idx_history_events_mappings_name_value ON history_events_mappings(name, value);
 CREATE INDEX IF NOT EXISTS idx_history_event_links_composite ON history_event_links(link_type, left_event_id, right_event_id);
 CREATE INDEX IF NOT EXISTS idx_history_event_link_ignores_type ON history_event_link_ignores(link_type);
 CREATE UNIQUE INDEX IF NOT EXISTS unique_generic_accounting_rules ON accounting_rules(type, subtype, counterparty) WHERE is_event_specific = 0;
@@ -132,10 +132,6 @@ def upgrade_v50_to_v51(db: 'DBHandler', progress_handler: 'DBUpgradeProgressHand
             FOREIGN KEY(event_id) REFERENCES history_events(identifier) ON DELETE CASCADE
         );
         """)
-        write_cursor.execute(
-            'CREATE INDEX IF NOT EXISTS idx_history_event_links_right '
-            'ON history_event_links(right_event_id);',
-        )
         write_cursor.execute(
             'CREATE INDEX IF NOT EXISTS idx_history_event_links_composite '
             'ON history_event_links(link_type, left_event_id, right_event_id);',
@@ -380,6 +376,21 @@ def upgrade_v50_to_v51(db: 'DBHandler', progress_handler: 'DBUpgradeProgressHand
 
             write_cursor.execute(table_sql)
 
+    @progress_step(description='Add index for the history event state markers.')
+    def _add_history_events_mappings_index(write_cursor: 'DBCursor') -> None:
+        write_cursor.execute(
+            'CREATE INDEX IF NOT EXISTS idx_history_events_mappings_name_value '
+            'ON history_events_mappings(name, value);',
+        )
+
+    @progress_step(description='Replace the history events asset index with an asset and timestamp index.')  # noqa: E501
+    def _replace_history_events_asset_index(write_cursor: 'DBCursor') -> None:
+        write_cursor.execute('DROP INDEX IF EXISTS idx_history_events_asset;')
+        write_cursor.execute(
+            'CREATE INDEX IF NOT EXISTS idx_history_events_asset_timestamp '
+            'ON history_events(asset, timestamp);',
+        )
+
     @progress_step(description='Clean duplicated internal tx rows with zero gas.')
     def _cleanup_internal_txs_with_zero_gas(write_cursor: 'DBCursor') -> None:
         """Remove internal tx rows with gas=0 when a non-zero gas duplicate exists.
@@ -1849,6 +1849,11 @@ def test_db_schema_sanity_check(database: 'DBHandler', caplog) -> None:
         write_cursor.execute('DROP TABLE user_notes')
         write_cursor.execute(DB_CREATE_USER_NOTES.lower())
     connection.schema_sanity_check()
+    # the sqlite_stat1 table created by the planner statistics should not be reported
+    with database.user_write() as write_cursor:
+        write_cursor.execute('ANALYZE')
+    connection.optimize()
+    connection.schema_sanity_check()
 
     assert 'Your user database has the following unexpected tables' not in caplog.text, 'Found unexpected table in clean DB'  # noqa: E501
     with suppress(ValueError), database.user_write() as cursor:
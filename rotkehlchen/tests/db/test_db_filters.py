@@ -91,6 +91,11 @@ def test_ignored_assets(database):
         assets_num = cursor.execute('SELECT COUNT(*) FROM assets').fetchone()[0]
         result = cursor.execute('SELECT COUNT(*) FROM assets WHERE ' + querystr[0], bindings).fetchone()[0]  # noqa: E501
         assert result == assets_num
+        # each row should be resolved by probing the (name, value) unique index
+        assert any(
+            'sqlite_autoindex_multisettings_1 (name=? AND value=?)' in row[3]
+            for row in cursor.execute('EXPLAIN QUERY PLAN SELECT COUNT(*) FROM assets WHERE ' + querystr[0], bindings)  # noqa: E501
+        )
 
     with database.user_write() as write_cursor:
         database.add_to_ignored_assets(write_cursor, A_ETH)
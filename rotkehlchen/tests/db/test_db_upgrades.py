@@ -3304,6 +3304,8 @@ def test_latest_upgrade_correctness(user_data_dir):
     this is just to reminds us not to forget to add create table statements.
     """
     msg_aggregator = MessagesAggregator()
+    # skip internal tables such as sqlite_stat1 which is created by PRAGMA optimize at logout
+    tables_query = "SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%'"
     base_database = f'v{ROTKEHLCHEN_DB_VERSION - 1}_rotkehlchen.db'
     _use_prepared_db(user_data_dir, base_database)
     last_db = _init_db_with_target_version(
@@ -3313,7 +3315,7 @@ def test_latest_upgrade_correctness(user_data_dir):
         resume_from_backup=False,
     )
     cursor = last_db.conn.cursor()
-    result = cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
+    result = cursor.execute(tables_query)
     tables_before = {x[0] for x in result}
     result = cursor.execute("SELECT name FROM sqlite_master WHERE type='view'")
     views_before = {x[0] for x in result}
@@ -3334,14 +3336,14 @@ def test_latest_upgrade_correctness(user_data_dir):
         minimized_schema=db.conn.minimized_schema,
         minimized_indexes=db.conn.minimized_indexes,
     )
-    result = cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
+    result = cursor.execute(tables_query)
     tables_after_upgrade = {x[0] for x in result}
     result = cursor.execute("SELECT name FROM sqlite_master WHERE type='view'")
     views_after_upgrade = {x[0] for x in result}
     # also add latest tables (this will indicate if DB upgrade missed something
     with db.conn.write_ctx() as write_cursor:
         write_cursor.executescript(DB_SCRIPT_CREATE_TABLES)
-    result = cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
+    result = cursor.execute(tables_query)
     tables_after_creation = {x[0] for x in result}
     result = cursor.execute("SELECT name FROM sqlite_master WHERE type='view'")
     views_after_creation = {x[0] for x in result}
@@ -3916,13 +3918,15 @@ def test_upgrade_db_50_to_51(user_data_dir, messages_aggregator):
             'idx_history_events_timestamp',
             'idx_history_events_location',
             'idx_history_events_location_label',
-            'idx_history_events_asset',
+            'idx_history_events_asset_timestamp',
             'idx_history_events_type',
             'idx_history_events_subtype',
             'idx_history_events_ignored',
             'idx_history_events_entry_type',
         ):
             assert index_exists(cursor=cursor, name=index_name)
+        # the asset index got replaced by the asset and timestamp one
+        assert not index_exists(cursor=cursor, name='idx_history_events_asset')
         assert cursor.execute(
             """
             SELECT COUNT(*)
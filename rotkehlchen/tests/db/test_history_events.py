@@ -1,5 +1,6 @@
+import itertools
 from collections.abc import Mapping
-from typing import Any
+from typing import TYPE_CHECKING, Any
 from unittest.mock import patch
 
 import gevent
@@ -28,7 +29,7 @@ from rotkehlchen.db.filtering import (
     EvmEventFilterQuery,
     HistoryEventFilterQuery,
 )
-from rotkehlchen.db.history_events import DBHistoryEvents
+from rotkehlchen.db.history_events import LATEST_GROUPS_SUBQUERY, DBHistoryEvents
 from rotkehlchen.fval import FVal
 from rotkehlchen.history.events.structures.asset_movement import AssetMovement
 from rotkehlchen.history.events.structures.base import (
@@ -55,7 +56,11 @@ from rotkehlchen.types import (
     deserialize_evm_tx_hash,
 )
 
+if TYPE_CHECKING:
+    from rotkehlchen.db.drivers.gevent import DBCursor
 
+
+@pytest.mark.parametrize('use_in_memory_userdb', [True])
 def test_get_event_mapping_states(database):
     db = DBHistoryEvents(database)
     with db.db.user_write() as write_cursor:
@@ -126,108 +131,151 @@ def test_get_event_mapping_states(database):
             location=Location.OPTIMISM,
             mapping_state=HistoryMappingState.CUSTOMIZED,
         ) == [4]
+        # state marker lookups should not need to scan the whole mappings table
+        assert any(
+            'USING INDEX idx_history_events_mappings_name_value (name=? AND value=?)' in row[3]
+            for row in cursor.execute(
+                'EXPLAIN QUERY PLAN SELECT parent_identifier FROM history_events_mappings '
+                'WHERE name=? AND value=?',
+                (HISTORY_MAPPING_KEY_STATE, HistoryMappingState.CUSTOMIZED.serialize_for_db()),
+            )
+        )
 
 
-def add_history_events_to_db(db: DBHistoryEvents, data: dict[int, tuple[str, TimestampMS, FVal, dict | None]]) -> None:  # noqa: E501
-    """Helper function to create HistoryEvent fixtures"""
+@pytest.mark.parametrize('use_in_memory_userdb', [True])
+@pytest.mark.parametrize('mapping_state', [None, HistoryMappingState.CUSTOMIZED])
+def test_get_event_mapping_states_multiple_mapping_rows(
+        database: DBHandler,
+        mapping_state: HistoryMappingState | None,
+) -> None:
+    """Test that filtering the mapping states by location returns an event only once
+    even if it has more mapping rows than the state one."""
+    db = DBHistoryEvents(database)
     with db.db.user_write() as write_cursor:
-        for entry in data.values():
-            db.add_history_event(
-                write_cursor=write_cursor,
-                event=HistoryEvent(
-                    group_identifier=entry[0],
-                    sequence_index=1,
-                    timestamp=entry[1],
-                    location=Location.ETHEREUM,
-                    event_type=HistoryEventType.TRADE,
-                    event_subtype=HistoryEventSubType.NONE,
-                    asset=A_ETH,
-                    amount=entry[2],
-                ),
-                mapping_values=entry[3],
-            )
+        identifier = db.add_history_event(
+            write_cursor=write_cursor,
+            event=HistoryEvent(
+                group_identifier='TEST_MAPPINGS',
+                sequence_index=0,
+                timestamp=TimestampMS(1),
+                location=Location.KRAKEN,
+                event_type=HistoryEventType.TRADE,
+                event_subtype=HistoryEventSubType.RECEIVE,
+                asset=A_ETH,
+                amount=ONE,
+            ),
+            mapping_values={HISTORY_MAPPING_KEY_STATE: HistoryMappingState.CUSTOMIZED},
+        )
+        write_cursor.executemany(
+            'INSERT INTO history_events_mappings(parent_identifier, name, value) '
+            'VALUES(?, ?, ?)',
+            [(identifier, 'other_key', 1), (identifier, 'other_key', 2)],
+        )
+
+    with db.db.conn.read_ctx() as cursor:
+        assert db.get_event_mapping_states(
+            cursor=cursor,
+            location=Location.KRAKEN,
+            mapping_state=mapping_state,
+        ) == ([identifier] if mapping_state is not None else {identifier: [HistoryMappingState.CUSTOMIZED]})  # noqa: E501
+
+
+def add_history_events_to_db(db: DBHistoryEvents, write_cursor: 'DBCursor', data: dict[int, tuple[str, TimestampMS, FVal, dict | None]]) -> None:  # noqa: E501
+    """Helper function to create HistoryEvent fixtures"""
+    for entry in data.values():
+        db.add_history_event(
+            write_cursor=write_cursor,
+            event=HistoryEvent(
+                group_identifier=entry[0],
+                sequence_index=1,
+                timestamp=entry[1],
+                location=Location.ETHEREUM,
+                event_type=HistoryEventType.TRADE,
+                event_subtype=HistoryEventSubType.NONE,
+                asset=A_ETH,
+                amount=entry[2],
+            ),
+            mapping_values=entry[3],
+        )
 
 
-def add_evm_events_to_db(db: DBHistoryEvents, data: Mapping[int, tuple[EVMTxHash, TimestampMS, FVal, str, str, dict | None]]) -> None:  # noqa: E501
+def add_evm_events_to_db(db: DBHistoryEvents, write_cursor: 'DBCursor', data: Mapping[int, tuple[EVMTxHash, TimestampMS, FVal, str, str, dict | None]]) -> None:  # noqa: E501
     """Helper function to create EvmEvent fixtures"""
-    with db.db.user_write() as write_cursor:
-        for entry in data.values():
-            db.add_history_event(
-                write_cursor=write_cursor,
-                event=EvmEvent(
-                    tx_ref=entry[0],
-                    sequence_index=1,
-                    timestamp=entry[1],
-                    location=Location.ETHEREUM,
-                    event_type=HistoryEventType.TRADE,
-                    event_subtype=HistoryEventSubType.NONE,
-                    asset=A_ETH,
-                    amount=entry[2],
-                    counterparty=entry[3],
-                    address=string_to_evm_address(entry[4]),
-                ),
-                mapping_values=entry[5],
-            )
+    for entry in data.values():
+        db.add_history_event(
+            write_cursor=write_cursor,
+            event=EvmEvent(
+                tx_ref=entry[0],
+                sequence_index=1,
+                timestamp=entry[1],
+                location=Location.ETHEREUM,
+                event_type=HistoryEventType.TRADE,
+                event_subtype=HistoryEventSubType.NONE,
+                asset=A_ETH,
+                amount=entry[2],
+                counterparty=entry[3],
+                address=string_to_evm_address(entry[4]),
+            ),
+            mapping_values=entry[5],
+        )
 
 
-def add_eth2_events_to_db(db: DBHistoryEvents, data: dict[int, tuple[EVMTxHash, TimestampMS, FVal, str, dict | None]]) -> None:  # noqa: E501
+def add_eth2_events_to_db(db: DBHistoryEvents, write_cursor: 'DBCursor', data: dict[int, tuple[EVMTxHash, TimestampMS, FVal, str, dict | None]]) -> None:  # noqa: E501
     """Helper function to create fixtures for various Beacon chain staking events"""
-    with db.db.user_write() as write_cursor:
-        for entry in data.values():
-            db.add_history_event(
-                write_cursor=write_cursor,
-                event=EthDepositEvent(
-                    identifier=1,
-                    tx_ref=entry[0],
-                    validator_index=42,
-                    sequence_index=1,
-                    timestamp=entry[1],
-                    amount=entry[2],
-                    depositor=string_to_evm_address(entry[3]),
-                ),
-                mapping_values=entry[4],
-            )
+    for entry in data.values():
+        db.add_history_event(
+            write_cursor=write_cursor,
+            event=EthDepositEvent(
+                identifier=1,
+                tx_ref=entry[0],
+                validator_index=42,
+                sequence_index=1,
+                timestamp=entry[1],
+                amount=entry[2],
+                depositor=string_to_evm_address(entry[3]),
+            ),
+            mapping_values=entry[4],
+        )
 
 
 def add_eth_deposit_events_to_db(
         db: DBHistoryEvents,
+        write_cursor: 'DBCursor',
         data: dict[int, tuple[EVMTxHash, TimestampMS, FVal, str, int]],
 ) -> None:
     """Helper function to create fixtures for eth deposit events with custom validators."""
-    with db.db.user_write() as write_cursor:
-        for entry in data.values():
-            db.add_history_event(
-                write_cursor=write_cursor,
-                event=EthDepositEvent(
-                    tx_ref=entry[0],
-                    validator_index=entry[4],
-                    sequence_index=1,
-                    timestamp=entry[1],
-                    amount=entry[2],
-                    depositor=string_to_evm_address(entry[3]),
-                ),
-            )
+    db.add_history_events(
+        write_cursor=write_cursor,
+        history=[EthDepositEvent(
+            tx_ref=entry[0],
+            validator_index=entry[4],
+            sequence_index=1,
+            timestamp=entry[1],
+            amount=entry[2],
+            depositor=string_to_evm_address(entry[3]),
+        ) for entry in data.values()],
+    )
 
 
 def add_eth_withdrawal_events_to_db(
         db: DBHistoryEvents,
+        write_cursor: 'DBCursor',
         data: dict[int, tuple[int, TimestampMS, FVal, str, bool]],
 ) -> None:
     """Helper function to create fixtures for eth withdrawal events with custom validators."""
-    with db.db.user_write() as write_cursor:
-        for entry in data.values():
-            db.add_history_event(
-                write_cursor=write_cursor,
-                event=EthWithdrawalEvent(
-                    validator_index=entry[0],
-                    timestamp=entry[1],
-                    amount=entry[2],
-                    withdrawal_address=string_to_evm_address(entry[3]),
-                    is_exit=entry[4],
-                ),
-            )
+    db.add_history_events(
+        write_cursor=write_cursor,
+        history=[EthWithdrawalEvent(
+            validator_index=entry[0],
+            timestamp=entry[1],
+            amount=entry[2],
+            withdrawal_address=string_to_evm_address(entry[3]),
+            is_exit=entry[4],
+        ) for entry in data.values()],
+    )
 
 
+@pytest.mark.parametrize('use_in_memory_userdb', [True])
 def test_read_write_events_from_db(database):
     db = DBHistoryEvents(database)
     history_data = {  # mapping of identifier to unique data
@@ -242,8 +290,9 @@ def test_read_write_events_from_db(database):
         7: (make_evm_tx_hash(), TimestampMS(7), FVal(7), 'compound', '0x19222290DD7278Aa3Ddd389Cc1E1d165CC4BAf34', None),  # noqa: E501
     }
 
-    add_history_events_to_db(db, history_data)
-    add_evm_events_to_db(db, evm_data)
+    with db.db.user_write() as write_cursor:
+        add_history_events_to_db(db, write_cursor, history_data)
+        add_evm_events_to_db(db, write_cursor, evm_data)
 
     # args for creating filter queries
     filter_query_args = [
@@ -287,6 +336,7 @@ def test_read_write_events_from_db(database):
                     assert event == expected_event
 
 
+@pytest.mark.parametrize('use_in_memory_userdb', [True])
 def test_history_events_count_with_chain_filters(database: DBHandler) -> None:
     """Ensure count queries work with chain fields (counterparty/address) filters."""
     db = DBHistoryEvents(database)
@@ -295,8 +345,9 @@ def test_history_events_count_with_chain_filters(database: DBHandler) -> None:
         2: (make_evm_tx_hash(), TimestampMS(2), ONE, 'aave', '0x85222290DD7278Aa3Ddd389Cc1E1d165CC4BAfe5', None),  # noqa: E501
         3: (make_evm_tx_hash(), TimestampMS(3), ONE, 'liquity', '0x95222290DD7278Aa3Ddd389Cc1E1d165CC4BAfe4', None),  # noqa: E501
     }
-    add_evm_events_to_db(db, evm_data)
-    add_history_events_to_db(db, {4: ('BASE1', TimestampMS(4), ONE, None)})
+    with db.db.user_write() as write_cursor:
+        add_evm_events_to_db(db, write_cursor, evm_data)
+        add_history_events_to_db(db, write_cursor, {4: ('BASE1', TimestampMS(4), ONE, None)})
 
     query = EvmEventFilterQuery.make(
         counterparties=['aave'],
@@ -324,6 +375,7 @@ def test_history_events_count_with_chain_filters(database: DBHandler) -> None:
         assert events[0].address == string_to_evm_address(evm_data[1][4])
 
 
+@pytest.mark.parametrize('use_in_memory_userdb', [True])
 def test_history_events_count_with_eth_deposit_filters(database: DBHandler) -> None:
     """Ensure count queries work with eth deposit tx_ref filters."""
     db = DBHistoryEvents(database)
@@ -333,7 +385,8 @@ def test_history_events_count_with_eth_deposit_filters(database: DBHandler) -> N
         1: (tx_hash_1, TimestampMS(10), ONE, '0x95222290DD7278Aa3Ddd389Cc1E1d165CC4BAfe5', 42),
         2: (tx_hash_2, TimestampMS(11), ONE, '0x85222290DD7278Aa3Ddd389Cc1E1d165CC4BAfe5', 84),
     }
-    add_eth_deposit_events_to_db(db, deposit_data)
+    with db.db.user_write() as write_cursor:
+        add_eth_deposit_events_to_db(db, write_cursor, deposit_data)
 
     query = EthDepositEventFilterQuery.make(
         tx_hashes=[tx_hash_1],
@@ -360,6 +413,7 @@ def test_history_events_count_with_eth_deposit_filters(database: DBHandler) -> N
         assert events[0].tx_ref == tx_hash_1
 
 
+@pytest.mark.parametrize('use_in_memory_userdb', [True])
 def test_history_events_count_with_eth_withdrawal_filters(database: DBHandler) -> None:
     """Ensure count queries work with eth withdrawal validator filters."""
     db = DBHistoryEvents(database)
@@ -367,7 +421,8 @@ def test_history_events_count_with_eth_withdrawal_filters(database: DBHandler) -
         1: (7, TimestampMS(20), ONE, '0x95222290DD7278Aa3Ddd389Cc1E1d165CC4BAfe5', True),
         2: (9, TimestampMS(21), ONE, '0x85222290DD7278Aa3Ddd389Cc1E1d165CC4BAfe5', False),
     }
-    add_eth_withdrawal_events_to_db(db, withdrawal_data)
+    with db.db.user_write() as write_cursor:
+        add_eth_withdrawal_events_to_db(db, write_cursor, withdrawal_data)
 
     query = EthWithdrawalFilterQuery.make(
         validator_indices=[7],
@@ -393,10 +448,8 @@ def test_history_events_count_with_eth_withdrawal_filters(database: DBHandler) -
         assert events[0].validator_index == 7
 
 
-@pytest.mark.parametrize(
-    ('entries_limit', 'aggregate_by_group_ids'), [(None, False), (None, True), (FREE_HISTORY_EVENTS_LIMIT, False), (FREE_HISTORY_EVENTS_LIMIT, True)],  # noqa: E501
-)
-def test_read_write_customized_events_from_db(database: DBHandler, entries_limit: int, aggregate_by_group_ids: bool) -> None:  # noqa: E501
+@pytest.mark.parametrize('use_in_memory_userdb', [True])
+def test_read_write_customized_events_from_db(database: DBHandler) -> None:
     """Tests filtering for fetching only the customized events"""
     db = DBHistoryEvents(database)
     history_data = {
@@ -416,9 +469,10 @@ def test_read_write_customized_events_from_db(database: DBHandler, entries_limit
         8: (tx_hashes[4], TimestampMS(8), FVal(8), '0x85222290DD7278Aa3Ddd389Cc1E1d165CC4BAfe5', {HISTORY_MAPPING_KEY_STATE: HistoryMappingState.CUSTOMIZED}),  # noqa: E501
     }
 
-    add_history_events_to_db(db, history_data)
-    add_evm_events_to_db(db, evm_data)
-    add_eth2_events_to_db(db, eth2_data)
+    with db.db.user_write() as write_cursor:
+        add_history_events_to_db(db, write_cursor, history_data)
+        add_evm_events_to_db(db, write_cursor, evm_data)
+        add_eth2_events_to_db(db, write_cursor, eth2_data)
 
     filter_query_args: list[
         tuple[
@@ -440,30 +494,34 @@ def test_read_write_customized_events_from_db(database: DBHandler, entries_limit
 
     with db.db.conn.read_ctx() as cursor:
         for (filtering_class, filter_args), expected_ids in zip(filter_query_args, expected_identifiers, strict=True):  # noqa: E501
-            events = db.get_history_events(
-                cursor=cursor,
-                filter_query=filtering_class.make(**filter_args),
-                entries_limit=entries_limit,
-                aggregate_by_group_ids=aggregate_by_group_ids,
-            )
-            if aggregate_by_group_ids is False:  # don't check the grouping case. Just make sure no exception is raised  # noqa: E501
-                filtered_ids = [x.tx_ref if isinstance(x, EvmEvent) else x.group_identifier for x in events]  # type: ignore  # events are not tuples when aggregate_by_group_ids is False  # noqa: E501
-                assert filtered_ids == expected_ids
+            filter_query = filtering_class.make(**filter_args)
+            for entries_limit, aggregate_by_group_ids in itertools.product((None, FREE_HISTORY_EVENTS_LIMIT), (False, True)):  # noqa: E501
+                events = db.get_history_events(
+                    cursor=cursor,
+                    filter_query=filter_query,
+                    entries_limit=entries_limit,
+                    aggregate_by_group_ids=aggregate_by_group_ids,
+                )
+                if aggregate_by_group_ids is False:  # don't check the grouping case. Just make sure no exception is raised  # noqa: E501
+                    filtered_ids = [x.tx_ref if isinstance(x, EvmEvent) else x.group_identifier for x in events]  # type: ignore  # events are not tuples when aggregate_by_group_ids is False  # noqa: E501
+                    assert filtered_ids == expected_ids
 
-            db.get_history_events_count(  # don't check result, just check for exception
-                cursor=cursor,
-                query_filter=filtering_class.make(**filter_args),
-                aggregate_by_group_ids=aggregate_by_group_ids,
-                entries_limit=entries_limit,
-            )
+                db.get_history_events_count(  # don't check result, just check for exception
+                    cursor=cursor,
+                    query_filter=filter_query,
+                    aggregate_by_group_ids=aggregate_by_group_ids,
+                    entries_limit=entries_limit,
+                )
 
 
+@pytest.mark.parametrize('use_in_memory_userdb', [True])
 def test_read_write_virtual_events_from_db(database: DBHandler) -> None:
-    add_history_events_to_db(DBHistoryEvents(database), {
-        1: ('TEST1', TimestampMS(1000), ONE, None),
-        2: ('TEST2', TimestampMS(2000), FVal(2), {HISTORY_MAPPING_KEY_STATE: HistoryMappingState.PROFIT_ADJUSTMENT}),  # noqa: E501
-        3: ('TEST3', TimestampMS(3000), FVal(3), None),
-    })
+    with database.user_write() as write_cursor:
+        add_history_events_to_db(DBHistoryEvents(database), write_cursor, {
+            1: ('TEST1', TimestampMS(1000), ONE, None),
+            2: ('TEST2', TimestampMS(2000), FVal(2), {HISTORY_MAPPING_KEY_STATE: HistoryMappingState.PROFIT_ADJUSTMENT}),  # noqa: E501
+            3: ('TEST3', TimestampMS(3000), FVal(3), None),
+        })
     with database.conn.read_ctx() as cursor:
         events = DBHistoryEvents(database).get_history_events(
             cursor=cursor,
@@ -478,6 +536,30 @@ def test_read_write_virtual_events_from_db(database: DBHandler) -> None:
         assert events[0].group_identifier == 'TEST2'
 
 
+@pytest.mark.parametrize('use_in_memory_userdb', [True])
+def test_add_history_events_sets_ignored(database: DBHandler) -> None:
+    """Test that events added in a batch get the ignored flag of their asset"""
+    db = DBHistoryEvents(database)
+    with database.user_write() as write_cursor:
+        database.add_to_ignored_assets(write_cursor, A_BTC)
+        db.add_history_events(write_cursor=write_cursor, history=[HistoryEvent(
+            group_identifier=f'TEST{idx}',
+            sequence_index=1,
+            timestamp=TimestampMS(1000 * idx),
+            location=Location.KRAKEN,
+            event_type=HistoryEventType.TRADE,
+            event_subtype=HistoryEventSubType.NONE,
+            asset=asset,
+            amount=ONE,
+        ) for idx, asset in enumerate((A_ETH, A_BTC, A_USDC))])
+
+    with database.conn.read_ctx() as cursor:
+        assert cursor.execute(
+            'SELECT group_identifier, ignored FROM history_events ORDER BY identifier',
+        ).fetchall() == [('TEST0', 0), ('TEST1', 1), ('TEST2', 0)]
+
+
+@pytest.mark.parametrize('use_in_memory_userdb', [True])
 def test_delete_last_event(database):
     """
     Test that if last event in a group is being deleted and it's not an EVM event,
@@ -513,6 +595,7 @@ def test_delete_last_event(database):
         assert len(db.get_history_events_internal(cursor, HistoryEventFilterQuery.make())) == 1, 'EVM event should be left'  # noqa: E501
 
 
+@pytest.mark.parametrize('use_in_memory_userdb', [True])
 def test_get_history_events_free_filter(database: 'DBHandler'):
     """Test that the history events filter works consistently with has_premium=True/False"""
     history_events = DBHistoryEvents(database=database)
@@ -628,7 +711,7 @@ def test_get_history_events_free_filter(database: 'DBHandler'):
         )
 
     with database.conn.read_ctx() as cursor:
-        # free and premium results should be same with len(events) < FREE_LIMIT
+        # all the filters should match events both when grouping and when not grouping
         for filters in (  # trying different filters with some combinations
             HistoryEventFilterQuery.make(location=Location.OPTIMISM),
             HistoryEventFilterQuery.make(assets=(A_ETH,)),
@@ -638,68 +721,53 @@ def test_get_history_events_free_filter(database: 'DBHandler'):
             HistoryEventFilterQuery.make(location=Location.KRAKEN),
             HistoryEventFilterQuery.make(exclude_ignored_assets=True),
         ):
-            assert history_events.get_history_events(  # when grouping
+            for aggregate_by_group_ids in (True, False):
+                assert history_events.get_history_events(
+                    cursor=cursor,
+                    filter_query=filters,
+                    entries_limit=None,
+                    aggregate_by_group_ids=aggregate_by_group_ids,
+                ) != []
+
+        for filters in (  # trying different filters with some combinations
+            HistoryEventFilterQuery.make(event_subtypes=[HistoryEventSubType.NONE]),
+            HistoryEventFilterQuery.make(assets=(A_ETH, A_USDT)),
+            HistoryEventFilterQuery.make(from_ts=Timestamp(2)),
+            HistoryEventFilterQuery.make(assets=(A_ETH, A_USDC, A_USDT)),
+            HistoryEventFilterQuery.make(exclude_ignored_assets=True),
+        ):
+            premium_grouped_result = history_events.get_history_events_internal(  # when grouping  # noqa: E501
                 cursor=cursor,
                 filter_query=filters,
-                entries_limit=None,
                 aggregate_by_group_ids=True,
-            ) == history_events.get_history_events(
+            )
+            assert len(premium_grouped_result) > 3
+            free_grouped_result = history_events.get_history_events(
                 cursor=cursor,
                 filter_query=filters,
-                entries_limit=None,
+                entries_limit=3,
                 aggregate_by_group_ids=True,
-            ) != []
-            assert history_events.get_history_events(  # when not grouping
+            )
+            assert len(free_grouped_result) == min(3, len(premium_grouped_result))
+            assert free_grouped_result == premium_grouped_result[-3:]
+            premium_result = history_events.get_history_events_internal(  # when not grouping
                 cursor=cursor,
                 filter_query=filters,
-                entries_limit=None,
                 aggregate_by_group_ids=False,
-            ) == history_events.get_history_events(
+            )
+            assert len(premium_result) > 3
+            free_result = history_events.get_history_events(
                 cursor=cursor,
                 filter_query=filters,
-                entries_limit=None,
+                entries_limit=3,
                 aggregate_by_group_ids=False,
-            ) != []
-
-        with patch(target='rotkehlchen.tests.db.test_history_events.FREE_HISTORY_EVENTS_LIMIT', new=3):  # noqa: E501
-            for filters in (  # trying different filters with some combinations
-                HistoryEventFilterQuery.make(event_subtypes=[HistoryEventSubType.NONE]),
-                HistoryEventFilterQuery.make(assets=(A_ETH, A_USDT)),
-                HistoryEventFilterQuery.make(from_ts=Timestamp(2)),
-                HistoryEventFilterQuery.make(assets=(A_ETH, A_USDC, A_USDT)),
-                HistoryEventFilterQuery.make(exclude_ignored_assets=True),
-            ):
-                premium_grouped_result = history_events.get_history_events_internal(  # when grouping  # noqa: E501
-                    cursor=cursor,
-                    filter_query=filters,
-                    aggregate_by_group_ids=True,
-                )
-                assert len(premium_grouped_result) > 3
-                free_grouped_result = history_events.get_history_events(
-                    cursor=cursor,
-                    filter_query=filters,
-                    entries_limit=FREE_HISTORY_EVENTS_LIMIT,
-                    aggregate_by_group_ids=True,
-                )
-                assert len(free_grouped_result) == min(3, len(premium_grouped_result))
-                assert free_grouped_result == premium_grouped_result[-3:]
-                premium_result = history_events.get_history_events_internal(  # when not grouping
-                    cursor=cursor,
-                    filter_query=filters,
-                    aggregate_by_group_ids=False,
-                )
-                assert len(premium_result) > 3
-                free_result = history_events.get_history_events(
-                    cursor=cursor,
-                    filter_query=filters,
-                    entries_limit=FREE_HISTORY_EVENTS_LIMIT,
-                    aggregate_by_group_ids=False,
-                )
-                for free_event in free_result:
-                    assert free_event.identifier is not None
-                    assert free_event.identifier > 3, 'Free sub-events should be from the latest 3 event groups'  # noqa: E501
+            )
+            for free_event in free_result:
+                assert free_event.identifier is not None
+                assert free_event.identifier > 3, 'Free sub-events should be from the latest 3 event groups'  # noqa: E501
 
 
+@pytest.mark.parametrize('use_in_memory_userdb', [True])
 def test_history_events_with_ignored_groups_excluding_assets(database: 'DBHandler') -> None:
     db = DBHistoryEvents(database)
     group_identifier = 'group_with_ignored_asset'
@@ -756,6 +824,7 @@ def test_history_events_with_ignored_groups_excluding_assets(database: 'DBHandle
     assert events_result_including.ignored_group_identifiers == {group_identifier}
 
 
+@pytest.mark.parametrize('use_in_memory_userdb', [True])
 @pytest.mark.parametrize('start_with_valid_premium', [True, False])
 def test_match_exact_events(database: 'DBHandler', start_with_valid_premium: bool) -> None:
     """Test that when toggling the match with exact events options
@@ -817,17 +886,18 @@ def test_match_exact_events(database: 'DBHandler', start_with_valid_premium: boo
             ],
         )
 
+    filter_query = EvmEventFilterQuery.make(assets=(A_DAI,))
     with database.conn.read_ctx() as cursor:
         result_match = db.get_history_events(
             cursor=cursor,
-            filter_query=EvmEventFilterQuery.make(assets=(A_DAI,)),
+            filter_query=filter_query,
             entries_limit=entries_limit,
             aggregate_by_group_ids=False,
             match_exact_events=True,
         )
         result_no_match = db.get_history_events(
             cursor=cursor,
-            filter_query=EvmEventFilterQuery.make(assets=(A_DAI,)),
+            filter_query=filter_query,
             entries_limit=entries_limit,
             aggregate_by_group_ids=False,
             match_exact_events=False,
@@ -836,18 +906,27 @@ def test_match_exact_events(database: 'DBHandler', start_with_valid_premium: boo
     assert len(result_match) == 2 and len(result_no_match) == 4
     assert all(entry.asset == A_DAI for entry in result_match)
 
+    # the asset filter should be resolved through its index and not by scanning all the events
+    query, bindings = DBHistoryEvents._create_history_events_query(
+        filter_query=filter_query,
+        entries_limit=None,
+    )
+    with database.conn.read_ctx() as cursor:
+        plan = [row[3] for row in cursor.execute(f'EXPLAIN QUERY PLAN {query}', bindings)]
+    assert 'SEARCH history_events USING INDEX idx_history_events_asset_timestamp (asset=?)' in plan
+
     # also check the case of grouping by id
     with database.conn.read_ctx() as cursor:
         result_match_grouped = db.get_history_events(
             cursor=cursor,
-            filter_query=EvmEventFilterQuery.make(assets=(A_DAI,)),
+            filter_query=filter_query,
             entries_limit=entries_limit,
             aggregate_by_group_ids=True,
             match_exact_events=True,
         )
         result_no_match_grouped = db.get_history_events(
             cursor=cursor,
-            filter_query=EvmEventFilterQuery.make(assets=(A_DAI,)),
+            filter_query=filter_query,
             entries_limit=entries_limit,
             aggregate_by_group_ids=True,
             match_exact_events=False,
@@ -857,6 +936,31 @@ def test_match_exact_events(database: 'DBHandler', start_with_valid_premium: boo
         assert result_match_grouped[0][1].asset == A_DAI
 
 
+@pytest.mark.parametrize('use_in_memory_userdb', [True])
+def test_latest_groups_subquery_uses_timestamp_index(database: 'DBHandler') -> None:
+    """Test that the latest groups selected for a limited query come from walking the
+    timestamp index and not from sorting the whole history_events table"""
+    with database.conn.read_ctx() as cursor:
+        for aggregate_by_group_ids, match_exact_events in itertools.product((False, True), repeat=2):  # noqa: E501
+            query, bindings = DBHistoryEvents._create_history_events_query(
+                filter_query=HistoryEventFilterQuery.make(),
+                entries_limit=FREE_HISTORY_EVENTS_LIMIT,
+                aggregate_by_group_ids=aggregate_by_group_ids,
+                match_exact_events=match_exact_events,
+            )
+            plan = [row[3] for row in cursor.execute(f'EXPLAIN QUERY PLAN {query}', bindings)]
+            assert 'SCAN history_events USING INDEX idx_history_events_timestamp' in plan
+
+        # the outer query orders the selected page, so check the subquery on its own
+        plan = [row[3] for row in cursor.execute(
+            f'EXPLAIN QUERY PLAN {LATEST_GROUPS_SUBQUERY}',
+            (FREE_HISTORY_EVENTS_LIMIT,),
+        )]
+        assert 'SCAN history_events USING INDEX idx_history_events_timestamp' in plan
+        assert 'USE TEMP B-TREE FOR ORDER BY' not in plan
+
+
+@pytest.mark.parametrize('use_in_memory_userdb', [True])
 @pytest.mark.skip(reason='Event modification tracking is temporarily removed.')
 def test_event_modification_tracks_earliest_timestamp(database: 'DBHandler') -> None:
     db = DBHistoryEvents(database)
@@ -992,6 +1096,7 @@ def test_event_modification_tracks_earliest_timestamp(database: 'DBHandler') ->
         ).fetchone()[0]) == ts_500  # updated to deleted event's timestamp
 
 
+@pytest.mark.parametrize('use_in_memory_userdb', [True])
 @pytest.mark.skip(reason='Event modification tracking is temporarily removed.')
 def test_modification_ts_updated_on_each_modification(database: 'DBHandler') -> None:
     db = DBHistoryEvents(database)
@@ -1044,6 +1149,7 @@ def test_modification_ts_updated_on_each_modification(database: 'DBHandler') ->
         ).fetchone()[0]) >= modification_ts1
 
 
+@pytest.mark.parametrize('use_in_memory_userdb', [True])
 def test_get_history_event_group_position(database: 'DBHandler') -> None:
     """Test that get_history_event_group_position returns the correct 0-based position
     of a group in the filtered and sorted (timestamp DESC) list of groups.
@@ -1144,6 +1250,47 @@ def test_get_history_event_group_position(database: 'DBHandler') -> None:
     assert db.get_history_event_group_position('GROUP4', eth_asset_filter) is None
 
 
+@pytest.mark.parametrize('use_in_memory_userdb', [True])
+def test_get_history_event_group_position_not_found(database: 'DBHandler') -> None:
+    """Test that a missing or filtered out group returns None from the existence probe
+    without building the ranking query, and that the probe seeks the group index"""
+    db = DBHistoryEvents(database)
+    with database.user_write() as write_cursor:
+        db.add_history_event(write_cursor=write_cursor, event=HistoryEvent(
+            group_identifier='GROUP1',
+            sequence_index=0,
+            timestamp=TimestampMS(1000),
+            location=Location.OPTIMISM,
+            event_type=HistoryEventType.TRADE,
+            event_subtype=HistoryEventSubType.SPEND,
+            asset=A_ETH,
+            amount=ONE,
+        ))
+
+    with patch.object(
+        DBHistoryEvents,
+        '_create_history_events_query',
+        wraps=DBHistoryEvents._create_history_events_query,
+    ) as ranking_query:
+        assert db.get_history_event_group_position('NONEXISTENT', HistoryEventFilterQuery.make()) is None  # noqa: E501
+        assert db.get_history_event_group_position(
+            'GROUP1',
+            HistoryEventFilterQuery.make(location=Location.ETHEREUM),
+        ) is None
+        assert ranking_query.call_count == 0
+        assert db.get_history_event_group_position('GROUP1', HistoryEventFilterQuery.make()) == 0
+        assert ranking_query.call_count == 1
+
+    query, bindings = DBHistoryEvents._create_group_exists_query(
+        group_identifier='GROUP1',
+        filter_query=HistoryEventFilterQuery.make(),
+    )
+    with database.conn.read_ctx() as cursor:
+        plan = [row[3] for row in cursor.execute(f'EXPLAIN QUERY PLAN {query}', bindings)]
+    assert 'SEARCH history_events USING COVERING INDEX sqlite_autoindex_history_events_1 (group_identifier=?)' in plan  # noqa: E501
+
+
+@pytest.mark.parametrize('use_in_memory_userdb', [True])
 def test_get_history_event_group_position_with_same_timestamp(database: 'DBHandler') -> None:
     """Test that groups with the same timestamp are ordered by group_identifier as tiebreaker."""
     db = DBHistoryEvents(database)
@@ -1191,6 +1338,7 @@ def test_get_history_event_group_position_with_same_timestamp(database: 'DBHandl
     assert db.get_history_event_group_position('GROUP_C', filter_query) == 2
 
 
+@pytest.mark.parametrize('use_in_memory_userdb', [True])
 def test_matched_filter_returns_canonical_entries(database: 'DBHandler') -> None:
     """Test that filtering by MATCHED returns only the canonical (movement) side per group.
 
@@ -1382,6 +1530,7 @@ def _setup_two_evm_transactions(database: DBHandler) -> tuple[EVMTxHash, EVMTxHa
     return tx_hash_a, tx_hash_b
 
 
+@pytest.mark.parametrize('use_in_memory_userdb', [True])
 def test_delete_location_events_customized_handling(database: DBHandler) -> None:
     """Verifies that delete_location_events handles customized events correctly based on
     the customized_handling parameter.
@@ -1459,6 +1608,7 @@ def test_delete_location_events_customized_handling(database: DBHandler) -> None
         ).fetchone()[0] == customized_id
 
 
+@pytest.mark.parametrize('use_in_memory_userdb', [True])
 def test_delete_events_by_tx_ref_preserves_customized_transaction(database: DBHandler) -> None:
     """Verifies that delete_events_by_tx_ref with customized_handling='preserve_transactions'
     preserves all events in a transaction when any event is customized.
@@ -1519,6 +1669,7 @@ def test_delete_events_by_tx_ref_preserves_customized_transaction(database: DBHa
         assert len(group_ids) == 1  # only tx_a's group_identifier remains
 
 
+@pytest.mark.parametrize('use_in_memory_userdb', [True])
 def test_reset_events_for_redecode_preserves_customized_transaction(database: DBHandler) -> None:
     """Verifies that reset_events_for_redecode preserves all events in a transaction when
     any event is customized, and keeps the decoded status for that transaction.
@@ -2,7 +2,7 @@ from collections.abc import Generator
 from contextlib import ExitStack
 from pathlib import Path
 from shutil import rmtree
-from typing import Any
+from typing import Any, Literal
 from unittest.mock import patch
 
 import pytest
@@ -12,6 +12,7 @@ from rotkehlchen.balances.manual import ManuallyTrackedBalance
 from rotkehlchen.chain.accounts import BlockchainAccounts
 from rotkehlchen.constants.misc import DEFAULT_SQL_VM_INSTRUCTIONS_CB, USERSDIR_NAME
 from rotkehlchen.db.dbhandler import DBHandler
+from rotkehlchen.db.drivers.gevent import DBConnection, DBConnectionType
 from rotkehlchen.db.settings import CachedSettings
 from rotkehlchen.tests.utils.database import (
     _use_prepared_db,
@@ -80,6 +81,32 @@ def fixture_sql_vm_instructions_cb() -> int:
     return DEFAULT_SQL_VM_INSTRUCTIONS_CB
 
 
+@pytest.fixture(name='use_in_memory_userdb')
+def fixture_use_in_memory_userdb() -> bool:
+    """If True the user and transient DBs live in memory and are not encrypted. This skips
+    the key derivation and the disk writes. Only for tests that don't need the DB files.
+
+    Note that ':memory:' connections skip the sqlcipher keying completely so tests using
+    this don't cover the migration or encryption behavior of the DB.
+    """
+    return False
+
+
+def _connect_in_memory(
+        self: DBHandler,
+        conn_attribute: Literal['conn', 'conn_transient'] = 'conn',
+) -> None:
+    """Replacement of DBHandler._connect that opens an unencrypted in-memory DB"""
+    connection = DBConnection(
+        path=':memory:',
+        connection_type=DBConnectionType.USER if conn_attribute == 'conn' else DBConnectionType.TRANSIENT,  # noqa: E501
+        sql_vm_instructions_cb=self.sql_vm_instructions_cb,
+    )
+    with connection.write_ctx() as write_cursor:
+        write_cursor.execute('PRAGMA foreign_keys=ON')
+    setattr(self, conn_attribute, connection)
+
+
 def _init_database(
         user_data_dir: Path,
         password: str,
@@ -97,6 +124,7 @@ def _init_database(
         sql_vm_instructions_cb: int,
         perform_upgrades_at_unlock: bool,
         skip_sync_globaldb_assets: bool,
+        use_in_memory_userdb: bool,
 ) -> DBHandler:
     if use_custom_database is not None:
         _use_prepared_db(user_data_dir, use_custom_database)
@@ -113,6 +141,8 @@ def _init_database(
             stack.enter_context(upgrades_patch)
         if skip_sync_globaldb_assets:
             stack.enter_context(mock_dbhandler_sync_globaldb_assets())
+        if use_in_memory_userdb is True:
+            stack.enter_context(patch.object(DBHandler, '_connect', new=_connect_in_memory))
         db = DBHandler(
             user_data_dir=user_data_dir,
             password=password,
@@ -154,6 +184,7 @@ def database(
         sql_vm_instructions_cb,
         perform_upgrades_at_unlock,
         skip_sync_globaldb_assets,
+        use_in_memory_userdb,
 ) -> Generator[DBHandler | None, None, None]:
     if not start_with_logged_in_user:
         yield None
@@ -175,6 +206,7 @@ def database(
             sql_vm_instructions_cb=sql_vm_instructions_cb,
             perform_upgrades_at_unlock=perform_upgrades_at_unlock,
             skip_sync_globaldb_assets=skip_sync_globaldb_assets,
+            use_in_memory_userdb=use_in_memory_userdb,
         )
         if new_db_unlock_actions is not None:
             perform_new_db_unlock_actions(db=db_handler, new_db_unlock_actions=new_db_unlock_actions)  # noqa: E501
@@ -79,11 +79,12 @@ def test_find_customized_event_duplicate_groups_filters_group_ids_in_sql(
             timestamp=timestamp,
         )
 
-    executed: list[tuple[str, tuple[Sequence, ...]]] = []
+    matching_statements: list[tuple[str, tuple[Sequence, ...]]] = []
     original_execute = DBCursor.execute
 
     def execute_spy(self, statement: str, *bindings: Sequence) -> DBCursor:
-        executed.append((statement, bindings))
+        if 'FROM history_events he' in statement:
+            matching_statements.append((statement, bindings))
         return original_execute(self, statement, *bindings)
 
     monkeypatch.setattr(DBCursor, 'execute', execute_spy)
@@ -93,11 +94,6 @@ def test_find_customized_event_duplicate_groups_filters_group_ids_in_sql(
         group_identifiers=[group_id_1],
     )
 
-    matching_statements = [
-        (statement, bindings)
-        for statement, bindings in executed
-        if 'FROM history_events he' in statement
-    ]
     assert matching_statements
     assert any(
         'he.group_identifier IN (' in statement
@@ -109,6 +105,16 @@ def test_find_customized_event_duplicate_groups_filters_group_ids_in_sql(
         for binding in bindings
     )
 
+    # the UNIQUE(group_identifier, sequence_index) index is used for the group filter
+    monkeypatch.undo()
+    with database.conn.read_ctx() as cursor:
+        for statement, bindings in matching_statements:
+            plan = cursor.execute(f'EXPLAIN QUERY PLAN {statement}', *bindings).fetchall()
+            assert any(
+                row[3].startswith('SEARCH he USING INDEX') and '(group_identifier=?)' in row[3]
+                for row in plan
+            )
+
 
 def test_customized_event_deposit(database: 'DBHandler') -> None:
     """Regression test for customized event depositing in pool
@@ -189,19 +195,18 @@ def test_customized_event_deposit(database: 'DBHandler') -> None:
                 address=ZERO_ADDRESS,
             ),
         ])
-        customized_id = write_cursor.execute(
-            'SELECT identifier FROM history_events WHERE group_identifier=? AND sequence_index=?',
-            (event.group_identifier, 2),
-        ).fetchone()[0]
         write_cursor.execute(
             'INSERT INTO history_events_mappings(parent_identifier, name, value) '
-            'VALUES(?, ?, ?)',
+            'SELECT identifier, ?, ? FROM history_events '
+            'WHERE group_identifier=? AND sequence_index=?',
             (
-                customized_id,
                 HISTORY_MAPPING_KEY_STATE,
                 HistoryMappingState.CUSTOMIZED.serialize_for_db(),
+                event.group_identifier,
+                2,
             ),
         )
+        assert write_cursor.rowcount == 1
 
     auto_fix_group_ids, manual_review_group_ids, _ = find_customized_event_duplicate_groups(
         database=database,
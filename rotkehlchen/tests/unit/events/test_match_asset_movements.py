@@ -32,7 +32,7 @@ from rotkehlchen.db.constants import (
     HistoryEventLinkType,
     HistoryMappingState,
 )
-from rotkehlchen.db.filtering import HistoryEventFilterQuery
+from rotkehlchen.db.filtering import AssetMovementMatchFilterQuery, HistoryEventFilterQuery
 from rotkehlchen.db.history_events import DBHistoryEvents
 from rotkehlchen.db.settings import (
     DEFAULT_ASSET_MOVEMENT_TIME_RANGE,
@@ -50,7 +50,10 @@ from rotkehlchen.history.events.structures.onchain_event import OnchainEvent
 from rotkehlchen.history.events.structures.solana_event import SolanaEvent
 from rotkehlchen.history.events.structures.types import HistoryEventSubType, HistoryEventType
 from rotkehlchen.tasks import events as task_events
-from rotkehlchen.tasks.events import match_asset_movements
+from rotkehlchen.tasks.events import (
+    ENTRY_TYPES_TO_EXCLUDE_FROM_MATCHING,
+    match_asset_movements,
+)
 from rotkehlchen.tests.fixtures import MockedWsMessage
 from rotkehlchen.tests.unit.test_eth2 import HOUR_IN_MILLISECONDS
 from rotkehlchen.tests.utils.factories import (
@@ -85,6 +88,7 @@ def _get_match_for_movement(cursor: 'DBCursor', movement_id: int | None) -> int
     ).fetchone()) is None else result[0]
 
 
+@pytest.mark.parametrize('use_in_memory_userdb', [True])
 @pytest.mark.parametrize('function_scope_initialize_mock_rotki_notifier', [True])
 def test_match_asset_movements(database: 'DBHandler') -> None:
     """Test that the asset movement matching logic works correctly.
@@ -405,6 +409,7 @@ def test_match_asset_movements(database: 'DBHandler') -> None:
         )) == 1
 
 
+@pytest.mark.parametrize('use_in_memory_userdb', [True])
 @pytest.mark.parametrize(('event_type', 'event_subtype'), [
     (HistoryEventType.WITHDRAWAL, HistoryEventSubType.REMOVE_ASSET),
     (HistoryEventType.RECEIVE, HistoryEventSubType.NONE),
@@ -479,6 +484,7 @@ def test_withdrawal_fee(
         assert _get_match_for_movement(cursor=cursor, movement_id=withdrawal_id) == receive_id
 
 
+@pytest.mark.parametrize('use_in_memory_userdb', [True])
 def test_multiple_close_matches_clustered(database: 'DBHandler') -> None:
     """Ensure clustered movements are matched to the closest amounts."""
     events_db = DBHistoryEvents(database)
@@ -489,8 +495,6 @@ def test_multiple_close_matches_clustered(database: 'DBHandler') -> None:
                 asset_movement_amount_tolerance=FVal('0.01'),
             ),
         )
-
-    with database.conn.write_ctx() as write_cursor:
         events_db.add_history_events(
             write_cursor=write_cursor,
             history=[EvmEvent(
@@ -545,6 +549,7 @@ def test_multiple_close_matches_clustered(database: 'DBHandler') -> None:
     assert matched_2 == evm_event_2_id
 
 
+@pytest.mark.parametrize('use_in_memory_userdb', [True])
 def test_customized_deposit(database: 'DBHandler') -> None:
     """Test matching a customized deposit event with a gas event present.
 
@@ -647,6 +652,7 @@ def test_customized_deposit(database: 'DBHandler') -> None:
         assert _get_match_for_movement(cursor=cursor, movement_id=movement_id) == customized_id
 
 
+@pytest.mark.parametrize('use_in_memory_userdb', [True])
 def test_gno_kraken_flow(database: 'DBHandler') -> None:
     """Test GNO deposit/withdrawal flow with fees and bridge event."""
     with database.conn.write_ctx() as write_cursor:
@@ -735,6 +741,7 @@ def test_gno_kraken_flow(database: 'DBHandler') -> None:
         assert _get_match_for_movement(cursor=cursor, movement_id=withdrawal_id) == withdraw_event_id  # noqa: E501
 
 
+@pytest.mark.parametrize('use_in_memory_userdb', [True])
 def test_match_asset_movements_settings(database: 'DBHandler') -> None:
     """Test that the amount tolerance and time range settings works correctly, with the match
     failing when tolerance or time range is too small but succeeding with higher values.
@@ -782,12 +789,7 @@ def test_match_asset_movements_settings(database: 'DBHandler') -> None:
 
         match_asset_movements(database=database)
         with database.conn.read_ctx() as cursor:
-            result = cursor.execute(
-                'SELECT right_event_id FROM history_event_links '
-                'WHERE left_event_id=? AND link_type=?',
-                (movement_id, HistoryEventLinkType.ASSET_MOVEMENT_MATCH.serialize_for_db()),
-            ).fetchone()
-            assert (None if result is None else result[0]) == expected_value
+            assert _get_match_for_movement(cursor=cursor, movement_id=movement_id) == expected_value  # noqa: E501
 
     # Verify the adjustment event was created properly
     with database.conn.read_ctx() as cursor:
@@ -805,6 +807,7 @@ def test_match_asset_movements_settings(database: 'DBHandler') -> None:
     assert all_events[2].group_identifier == matched_event.group_identifier
 
 
+@pytest.mark.parametrize('use_in_memory_userdb', [True])
 def test_auto_ignore_by_asset(database: 'DBHandler') -> None:
     """Test that movements are auto-ignored if their asset is for an unsupported chain."""
     events_db = DBHistoryEvents(database)
@@ -842,6 +845,7 @@ def test_auto_ignore_by_asset(database: 'DBHandler') -> None:
         }
 
 
+@pytest.mark.parametrize('use_in_memory_userdb', [True])
 @pytest.mark.parametrize('number_of_arbitrum_one_accounts', [2])
 def test_ignore_transfers_between_tracked_accounts(
         database: 'DBHandler',
@@ -892,6 +896,7 @@ def test_ignore_transfers_between_tracked_accounts(
     _match_and_check(database=database, expected_matches=[(movement_id, match_id)])
 
 
+@pytest.mark.parametrize('use_in_memory_userdb', [True])
 def test_timestamp_tolerance(database: 'DBHandler') -> None:
     """Test that events that are not on the expected side of the asset movement can still be
     auto matched as long as they are within the 1 hour tolerance.
@@ -936,6 +941,7 @@ def test_timestamp_tolerance(database: 'DBHandler') -> None:
     _match_and_check(database=database, expected_matches=[(movement_id, match_id)])
 
 
+@pytest.mark.parametrize('use_in_memory_userdb', [True])
 def test_exchange_deposit_delayed_credit(database: 'DBHandler') -> None:
     """Test matching a delayed exchange deposit credit to the onchain spend."""
     events_db = DBHistoryEvents(database)
@@ -982,6 +988,7 @@ def test_exchange_deposit_delayed_credit(database: 'DBHandler') -> None:
     }}
 
 
+@pytest.mark.parametrize('use_in_memory_userdb', [True])
 def test_exchange_deposit_sai_to_dai_credit(database: 'DBHandler') -> None:
     """Test matching a SAI onchain deposit with a DAI exchange credit."""
     events_db = DBHistoryEvents(database)
@@ -1056,16 +1063,17 @@ def test_manual_matchable_asset_pairs(
     get_assets_in_same_collection.assert_called_once_with(identifier=movement_asset.identifier)
 
 
+@pytest.mark.parametrize('use_in_memory_userdb', [True])
 def test_adjustments(database: 'DBHandler') -> None:
     """Test that we properly create adjustment events during matching if amounts differ."""
     events_db = DBHistoryEvents(database)
 
     events_to_add = []
-    movement_data: list[tuple[Asset, AssetMovementSubtype, float, float]] = [
-        (A_ETH, HistoryEventSubType.RECEIVE, 5.49, 5.5),
-        (A_BTC, HistoryEventSubType.RECEIVE, 5.5, 5.49),
-        (A_USDC, HistoryEventSubType.SPEND, 5.49, 5.5),
-        (A_WSOL, HistoryEventSubType.SPEND, 5.5, 5.49),
+    movement_data: list[tuple[Asset, AssetMovementSubtype, FVal, FVal]] = [
+        (A_ETH, HistoryEventSubType.RECEIVE, (small_amount := FVal('5.49')), (big_amount := FVal('5.5'))),  # noqa: E501
+        (A_BTC, HistoryEventSubType.RECEIVE, big_amount, small_amount),
+        (A_USDC, HistoryEventSubType.SPEND, small_amount, big_amount),
+        (A_WSOL, HistoryEventSubType.SPEND, big_amount, small_amount),
     ]
     for idx, (asset, movement_subtype, movement_amount, match_amount) in enumerate(movement_data):
         events_to_add.extend([(movement_event := AssetMovement(
@@ -1073,7 +1081,7 @@ def test_adjustments(database: 'DBHandler') -> None:
             event_subtype=movement_subtype,
             timestamp=TimestampMS(1600000000000 + idx),
             asset=asset,
-            amount=FVal(movement_amount),
+            amount=movement_amount,
             location_label='kraken',
         )), HistoryEvent(  # Existing adjustment event should be replaced
             group_identifier=movement_event.group_identifier,
@@ -1095,7 +1103,7 @@ def test_adjustments(database: 'DBHandler') -> None:
             ),
             event_subtype=HistoryEventSubType.NONE,
             asset=asset,
-            amount=FVal(match_amount),
+            amount=match_amount,
         )])
 
     with database.conn.write_ctx() as write_cursor:
@@ -1107,23 +1115,24 @@ def test_adjustments(database: 'DBHandler') -> None:
     # Run matching and check that the adjustment events were created with proper subtypes
     match_asset_movements(database=database)
     with database.conn.read_ctx() as cursor:
-        for asset, expected_adjustment_subtype in (
-            (A_ETH, HistoryEventSubType.SPEND),
-            (A_BTC, HistoryEventSubType.RECEIVE),
-            (A_USDC, HistoryEventSubType.RECEIVE),
-            (A_WSOL, HistoryEventSubType.SPEND),
-        ):
-            assert len(events := events_db.get_history_events_internal(
-                cursor=cursor,
-                filter_query=HistoryEventFilterQuery.make(
-                    assets=(asset,),
-                    event_types=[HistoryEventType.EXCHANGE_ADJUSTMENT],
-                ),
-            )) == 1
-            assert events[0].event_subtype == expected_adjustment_subtype
-            assert events[0].amount == FVal('0.01')
+        adjustment_events = events_db.get_history_events_internal(
+            cursor=cursor,
+            filter_query=HistoryEventFilterQuery.make(
+                event_types=[HistoryEventType.EXCHANGE_ADJUSTMENT],
+            ),
+        )
+
+    assert len(adjustment_events) == 4
+    assert {event.asset: event.event_subtype for event in adjustment_events} == {
+        A_ETH: HistoryEventSubType.SPEND,
+        A_BTC: HistoryEventSubType.RECEIVE,
+        A_USDC: HistoryEventSubType.RECEIVE,
+        A_WSOL: HistoryEventSubType.SPEND,
+    }
+    assert all(event.amount == FVal('0.01') for event in adjustment_events)
 
 
+@pytest.mark.parametrize('use_in_memory_userdb', [True])
 def test_deposit_withdrawal_direction(database: 'DBHandler') -> None:
     """Test that when there are multiple close matches due to the accounting direction being
     neutral that we narrow the match with deposits as OUT events and withdrawals as IN events.
@@ -1172,6 +1181,7 @@ def test_deposit_withdrawal_direction(database: 'DBHandler') -> None:
             write_cursor.execute('DELETE FROM history_events')
 
 
+@pytest.mark.parametrize('use_in_memory_userdb', [True])
 def test_match_by_transaction_id_without_0x_prefix(database: 'DBHandler') -> None:
     """Match by tx hash when movement transaction_id is missing the 0x prefix."""
     tx_hash = make_evm_tx_hash()
@@ -1222,6 +1232,7 @@ def test_match_by_transaction_id_without_0x_prefix(database: 'DBHandler') -> Non
     _match_and_check(database=database, expected_matches=[(movement_id, match_id)])
 
 
+@pytest.mark.parametrize('use_in_memory_userdb', [True])
 def test_reprocess_ambiguous_movement_after_candidate_gets_matched(database: 'DBHandler') -> None:
     """Retry ambiguous movements when one of their candidates gets matched later."""
     tx_ref = make_evm_tx_hash()
@@ -1285,6 +1296,7 @@ def test_reprocess_ambiguous_movement_after_candidate_gets_matched(database: 'DB
     )
 
 
+@pytest.mark.parametrize('use_in_memory_userdb', [True])
 def test_retry_ambiguous_movement_stays_ambiguous(database: 'DBHandler') -> None:
     """Retry path should update candidate mappings when ambiguity remains."""
     with database.conn.write_ctx() as write_cursor:
@@ -1365,6 +1377,7 @@ def test_retry_ambiguous_movement_stays_ambiguous(database: 'DBHandler') -> None
     assert [len(call.kwargs['matched_events']) for call in ambiguous_calls] == [3, 2]
 
 
+@pytest.mark.parametrize('use_in_memory_userdb', [True])
 def test_retry_ambiguous_movement_loses_all_candidates(database: 'DBHandler') -> None:
     """Retry path should clear candidate mappings when no candidates remain."""
     with database.conn.write_ctx() as write_cursor:
@@ -1448,6 +1461,7 @@ def test_retry_ambiguous_movement_loses_all_candidates(database: 'DBHandler') ->
     assert [len(call.kwargs['matched_events']) for call in ambiguous_calls] == [2, 0]
 
 
+@pytest.mark.parametrize('use_in_memory_userdb', [True])
 def test_match_coinbasepro_coinbase_transfer(database: 'DBHandler') -> None:
     """CoinbasePro transfers and Coinbase transfer-note movements are auto-ignored."""
     with database.conn.write_ctx() as write_cursor:
@@ -1502,6 +1516,7 @@ def test_match_coinbasepro_coinbase_transfer(database: 'DBHandler') -> None:
     assert ignored_ids == {1, 2, 3, 4}
 
 
+@pytest.mark.parametrize('use_in_memory_userdb', [True])
 def test_coinbasepro_transfer_with_onchain_event(database: 'DBHandler') -> None:
     """CoinbasePro and Coinbase transfer-note movements are not matched to onchain events."""
     with database.conn.write_ctx() as write_cursor:
@@ -1563,6 +1578,7 @@ def test_coinbasepro_transfer_with_onchain_event(database: 'DBHandler') -> None:
     assert match_id == 1  # Onchain event should not be ignored.
 
 
+@pytest.mark.parametrize('use_in_memory_userdb', [True])
 def test_auto_ignored_movements_excluded_as_candidates(database: 'DBHandler') -> None:
     """Auto-ignored movements (e.g. Coinbase Pro) are not considered candidate matches."""
     with database.conn.write_ctx() as write_cursor:
@@ -1604,6 +1620,7 @@ def test_auto_ignored_movements_excluded_as_candidates(database: 'DBHandler') ->
     )
 
 
+@pytest.mark.parametrize('use_in_memory_userdb', [True])
 def test_coinbase_unprefixed_hash(database: 'DBHandler') -> None:
     """Coinbase withdrawal still matches unprefixed tx hash while transfer movements are
     ignored.
@@ -1679,6 +1696,7 @@ def test_coinbase_unprefixed_hash(database: 'DBHandler') -> None:
     }
 
 
+@pytest.mark.parametrize('use_in_memory_userdb', [True])
 def test_no_double_link_coinbase_withdrawal(database: 'DBHandler') -> None:
     """Regression test for double linking a Coinbase withdrawal.
 
@@ -1774,6 +1792,7 @@ def test_no_double_link_coinbase_withdrawal(database: 'DBHandler') -> None:
     assert (coinbasepro_withdrawal_id, coinbase_deposit_id) not in set(links)
 
 
+@pytest.mark.parametrize('use_in_memory_userdb', [True])
 def test_deposit_to_anon(database: 'DBHandler') -> None:
     """Regression test for wrong pairing when a deposit is followed by a withdrawal.
 
@@ -1858,3 +1877,24 @@ def test_deposit_to_anon(database: 'DBHandler') -> None:
 
     assert deposit_match == group_id_to_identifier[spend_event.group_identifier]  # outgoing_event_id  # noqa: E501
     assert withdrawal_match == group_id_to_identifier[receive_event.group_identifier]  # incoming_event_id  # noqa: E501
+
+
+@pytest.mark.parametrize('use_in_memory_userdb', [True])
+def test_candidates_query_uses_asset_timestamp_index(database: 'DBHandler') -> None:
+    """Check that the candidate events of each movement are searched by asset and timestamp
+    range in the index instead of checking all the events of the asset."""
+    query, bindings = DBHistoryEvents._create_history_events_query(
+        filter_query=AssetMovementMatchFilterQuery.make(
+            asset_timestamp_ranges=[
+                ((A_ETH, A_WETH_OPT), TimestampMS(1600000000000), TimestampMS(1600000100000)),
+                ((A_USDC,), TimestampMS(1610000000000), TimestampMS(1610000100000)),
+            ],
+            entry_types_to_exclude=ENTRY_TYPES_TO_EXCLUDE_FROM_MATCHING,
+        ),
+        entries_limit=None,
+    )
+    with database.conn.read_ctx() as cursor:
+        plan = [row[3] for row in cursor.execute(f'EXPLAIN QUERY PLAN {query}', bindings)]
+    assert plan.count(
+        'SEARCH history_events USING INDEX idx_history_events_asset_timestamp (asset=? AND timestamp>? AND timestamp<?)',  # noqa: E501
+    ) == 2
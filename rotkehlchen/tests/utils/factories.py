@@ -52,7 +52,7 @@ ADDRESS_OP = string_to_evm_address('0x3D61AEBB1238062a21BE5CC79df308f030BF0c1B')
 
 
 def make_random_bytes(size: int) -> bytes:
-    return bytes(bytearray(random.getrandbits(8) for _ in range(size)))
+    return random.randbytes(size)
 
 
 def make_random_b64bytes(size: int) -> bytes: